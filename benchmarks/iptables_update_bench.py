@@ -0,0 +1,268 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# (c) Copyright 2018 SUSE LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+'''Benchmark the rule generation and table rewriting in iptables_update.
+
+Synthetic rules and ardana_chains inputs, from 10 rules in 1 chain up to
+100k rules in 200 chains, are fed through the module and merged into the
+recorded iptables-save output in fixtures/. run_command is faked, so
+nothing on the host is changed and the benchmark can be run as any user.
+
+Each size class runs in its own process so its peak memory can be
+reported. The module needs ansible to be importable, as it is on the
+deployer.
+
+    python benchmarks/iptables_update_bench.py [--max-rules N] [--repeat N]
+'''
+
+import argparse
+import imp
+import json
+import os
+import random
+import sys
+import time
+
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+MODULE_PATH = os.path.join(BENCH_DIR, os.pardir, 'library', 'iptables_update')
+FIXTURE_PATH = os.path.join(BENCH_DIR, 'fixtures', 'iptables-save.v4')
+
+# (rules, chains)
+SIZE_CLASSES = [
+    (10, 1),
+    (100, 5),
+    (1000, 20),
+    (10000, 50),
+    (100000, 200),
+]
+
+# Share of the rules that differ between the installed and new rules
+CHANGED_SHARE = 0.1
+
+
+class FakeModule(object):
+    '''Enough of AnsibleModule for the functions being benchmarked.
+       iptables-save returns the saved lines, everything else succeeds.
+    '''
+
+    def __init__(self, saved):
+        self.saved = '\n'.join(saved)
+
+    def run_command(self, cmd, data=None):
+        if cmd.split()[0].endswith('-save'):
+            return 0, self.saved, ''
+        return 0, '', ''
+
+    def fail_json(self, **kwargs):
+        raise Exception(kwargs.get('msg'))
+
+
+def make_input(rule_count, chain_count, seed):
+    '''Return synthetic (rules, ardana_chains) module arguments, with
+       about a tenth of the addresses being IPv6.
+    '''
+    rand = random.Random(seed)
+    chains = [dict(name='NET-%03d' % idx, interface='vlan%d' % (100 + idx))
+              for idx in range(chain_count)]
+    rules = {}
+    for idx in range(rule_count):
+        chain = chains[idx % chain_count]['name']
+        host = idx // chain_count % 50
+        if host % 10 == 9:
+            address = 'fd00:%x::%x' % (idx % chain_count, host + 1)
+        else:
+            address = '10.%d.%d.%d' % (idx % chain_count // 250,
+                                       idx % chain_count % 250, host + 1)
+        rule = {'chain': chain, 'type': 'allow',
+                'protocol': rand.choice(['tcp', 'tcp', 'tcp', 'udp']),
+                'port-range-min': rand.randint(1024, 65535)}
+        rule['port-range-max'] = rule['port-range-min']
+        if rand.random() < 0.2:
+            rule['remote-ip-prefix'] = '192.168.%d.0/24' % rand.randint(0,
+                                                                       255)
+        rules.setdefault(address, []).append(rule)
+    return rules, chains
+
+
+def generate(ipu, rules, chains, optimize=False):
+    '''Run the rule generation the module does and return the ip4 and
+       ip6 commands.
+    '''
+    ipu._chain_names.clear()
+    cmds = []
+    cmds_ip6 = []
+    module = FakeModule([])
+    ipu.create_root_chains(chains, ipu.ROOT_PREFIX, cmds, cmds_ip6)
+    if optimize:
+        ipu.append_optimized_rules(module, rules, ipu.ROOT_PREFIX, cmds,
+                                   cmds_ip6)
+    else:
+        ipu.append_rules(module, rules, ipu.ROOT_PREFIX, cmds, cmds_ip6)
+    ipu.append_default_rules(chains, ipu.ROOT_PREFIX, True, cmds, cmds_ip6)
+    return cmds, cmds_ip6
+
+
+def installed_tables(ipu, fixture, cmds):
+    '''Return the fixture with cmds installed in its filter table, as
+       iptables-save -c would print it.
+    '''
+    saved = ipu.IptablesSave(fixture)
+    rules = [('[0:0] ' + cmd if cmd.startswith('-A') else cmd)
+             for cmd in cmds]
+    return saved.replace_chains(ipu.FILTER_TABLE_NAME, ipu.ROOT_PREFIX,
+                                rules)
+
+
+def plan_update(ipu, module, cmds):
+    '''Plan the update from scratch, as a new run of the module would.'''
+    ipu._canonical_rules.clear()
+    return ipu.plan_iptables_filters(module, ipu.ROOT_PREFIX, cmds,
+                                     'iptables')
+
+
+def timed(repeat, function, *args):
+    '''Return the result of the last call and the best time of repeat
+       calls.
+    '''
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        result = function(*args)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return result, best
+
+
+def run_class(ipu, fixture, rule_count, chain_count, repeat):
+    '''Time each stage for one size class, returns a dict of results.'''
+    rules, chains = make_input(rule_count, chain_count, 1)
+    old_rules, _ = make_input(rule_count, chain_count, 2)
+    # only part of the installed rules differ from the new ones
+    for address in list(old_rules)[int(len(old_rules) * CHANGED_SHARE):]:
+        if address in rules:
+            old_rules[address] = rules[address]
+
+    result = dict(rules=rule_count, chains=chain_count)
+    (cmds, cmds_ip6), result['generate'] = timed(repeat, generate, ipu,
+                                                 rules, chains)
+    _, result['generate_optimized'] = timed(repeat, generate, ipu, rules,
+                                            chains, True)
+    result['generated_rules'] = len(cmds) + len(cmds_ip6)
+
+    old_cmds, _ = generate(ipu, old_rules, chains)
+    saved = installed_tables(ipu, fixture, old_cmds)
+
+    module = FakeModule(saved)
+    _, result['parse'] = timed(repeat, ipu.IptablesSave, saved)
+    plan, result['diff'] = timed(repeat, plan_update, ipu, module,
+                                 cmds)
+    result['restore_lines'] = len(plan[1])
+    result['restore_bytes'] = len('\n'.join(plan[1]))
+    merged, result['purge_merge'] = timed(
+        repeat, lambda: ipu.update_persisted_iptables_filters(
+            module, ipu.IptablesSave(saved), cmds, ipu.ROOT_PREFIX))
+    result['persisted_lines'] = len(merged)
+    return result
+
+
+def run_forked(ipu, fixture, rule_count, chain_count, repeat):
+    '''Run a size class in a child process and return its results along
+       with its peak resident memory in KiB.
+    '''
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        status = 0
+        try:
+            result = run_class(ipu, fixture, rule_count, chain_count, repeat)
+            os.write(write_fd, json.dumps(result))
+        except Exception as e:
+            sys.stderr.write('%d rules in %d chains failed: %s\n' %
+                             (rule_count, chain_count, e))
+            status = 1
+        os._exit(status)
+
+    os.close(write_fd)
+    output = []
+    while True:
+        data = os.read(read_fd, 65536)
+        if not data:
+            break
+        output.append(data)
+    os.close(read_fd)
+    _, status, usage = os.wait4(pid, 0)
+    if status != 0:
+        return None
+    result = json.loads(''.join(output))
+    # ru_maxrss is in KiB on Linux
+    result['peak_kib'] = usage.ru_maxrss
+    return result
+
+
+def report(results, out):
+    columns = [('rules', '%8d'), ('chains', '%6d'),
+               ('generate', '%9.3f'), ('generate_optimized', '%9.3f'),
+               ('parse', '%9.3f'), ('diff', '%9.3f'),
+               ('purge_merge', '%9.3f'), ('restore_bytes', '%10d'),
+               ('peak_kib', '%9d')]
+    headers = ['rules', 'chains', 'gen s', 'opt s', 'parse s', 'diff s',
+               'merge s', 'restore B', 'peak KiB']
+    widths = [len(fmt % 0) for name, fmt in columns]
+    out.write(' '.join(header.rjust(width)
+                       for header, width in zip(headers, widths)) + '\n')
+    for result in results:
+        out.write(' '.join(fmt % result[name] for name, fmt in columns) +
+                  '\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--max-rules', type=int, default=100000,
+                        help='skip the size classes with more rules')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='report the best of this many runs')
+    parser.add_argument('--json', action='store_true',
+                        help='print the results as JSON')
+    args = parser.parse_args()
+
+    ipu = imp.load_source('iptables_update', MODULE_PATH)
+    with open(FIXTURE_PATH) as ffile:
+        fixture = ffile.read().splitlines()
+
+    results = []
+    for rule_count, chain_count in SIZE_CLASSES:
+        if rule_count > args.max_rules:
+            continue
+        result = run_forked(ipu, fixture, rule_count, chain_count,
+                            args.repeat)
+        if result is None:
+            return 1
+        results.append(result)
+
+    if args.json:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+    else:
+        report(results, sys.stdout)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+#
+# (c) Copyright 2018 SUSE LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+'''Read the network links from the kernel with a single rtnetlink dump,
+rather than running and parsing 'ip link show'. Used by restart_networking
+and probe.
+'''
+
+import os
+import socket
+import struct
+
+# rtnetlink, from linux/netlink.h, linux/rtnetlink.h and linux/if_link.h
+NETLINK_ROUTE = 0
+NETLINK_BUFFER_SIZE = 262144
+NLMSG_HEADER = '=IHHII'
+NLMSG_HEADER_LEN = struct.calcsize(NLMSG_HEADER)
+IFINFOMSG = '=BxHiII'
+IFINFOMSG_LEN = struct.calcsize(IFINFOMSG)
+RTATTR_HEADER = '=HH'
+RTATTR_HEADER_LEN = struct.calcsize(RTATTR_HEADER)
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+NLA_TYPE_MASK = 0x3fff
+RTM_NEWLINK = 16
+RTM_GETLINK = 18
+IFLA_ADDRESS = 1
+IFLA_IFNAME = 3
+IFLA_LINK = 5
+IFLA_MASTER = 10
+IFLA_OPERSTATE = 16
+IFLA_LINKINFO = 18
+IFLA_INFO_KIND = 1
+ARPHRD_ETHER = 1
+# IF_OPER_* in the order of their values, as 'ip link' shows them
+OPERSTATES = ('UNKNOWN', 'NOTPRESENT', 'DOWN', 'LOWERLAYERDOWN', 'TESTING',
+              'DORMANT', 'UP')
+
+
+def get_links():
+    '''Return the network links, from a single rtnetlink dump, as a list
+       of dicts with the index, name, state (the operstate, e.g. 'UP'),
+       type (the ARPHRD_ hardware type), mac, master, parent and kind
+       (e.g. 'vlan' or 'bond', None for physical devices) of each.
+    '''
+    sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+    links = []
+    try:
+        sock.bind((0, 0))
+        sock.send(struct.pack(NLMSG_HEADER, NLMSG_HEADER_LEN + IFINFOMSG_LEN,
+                              RTM_GETLINK, NLM_F_REQUEST | NLM_F_DUMP, 1, 0) +
+                  struct.pack(IFINFOMSG, socket.AF_UNSPEC, 0, 0, 0, 0))
+        done = False
+        while not done:
+            data = sock.recv(NETLINK_BUFFER_SIZE)
+            if not data:
+                break
+            offset = 0
+            while offset + NLMSG_HEADER_LEN <= len(data):
+                length, msg_type, _, _, _ = struct.unpack_from(
+                    NLMSG_HEADER, data, offset)
+                if length < NLMSG_HEADER_LEN:
+                    break
+                if msg_type == NLMSG_DONE:
+                    done = True
+                    break
+                if msg_type == NLMSG_ERROR:
+                    error = struct.unpack_from(
+                        '=i', data, offset + NLMSG_HEADER_LEN)[0]
+                    if error:
+                        raise OSError(-error, os.strerror(-error))
+                elif msg_type == RTM_NEWLINK:
+                    links.append(_parse_link(data, offset + NLMSG_HEADER_LEN,
+                                             offset + length))
+                offset += _nlmsg_align(length)
+    finally:
+        sock.close()
+
+    names = dict((link['index'], link['name']) for link in links)
+    for link in links:
+        link['master'] = names.get(link['master'])
+        link['parent'] = names.get(link['parent'])
+    return links
+
+
+def _nlmsg_align(length):
+    return (length + 3) & ~3
+
+
+def _parse_attributes(data, offset, end):
+    # Return a dict of the rtattr type to its payload
+    attributes = {}
+    while offset + RTATTR_HEADER_LEN <= end:
+        length, attr_type = struct.unpack_from(RTATTR_HEADER, data, offset)
+        if length < RTATTR_HEADER_LEN:
+            break
+        attributes[attr_type & NLA_TYPE_MASK] = \
+            data[offset + RTATTR_HEADER_LEN:offset + length]
+        offset += _nlmsg_align(length)
+    return attributes
+
+
+def _parse_link(data, offset, end):
+    _, link_type, index, _, _ = struct.unpack_from(IFINFOMSG, data, offset)
+    attributes = _parse_attributes(data, offset + IFINFOMSG_LEN, end)
+    operstate = ord(attributes.get(IFLA_OPERSTATE, '\0'))
+    link = dict(index=index, type=link_type,
+                name=attributes.get(IFLA_IFNAME, '').rstrip('\0'),
+                state=(OPERSTATES[operstate] if operstate < len(OPERSTATES)
+                       else 'UNKNOWN'),
+                mac=None, master=None, parent=None, kind=None)
+    if IFLA_ADDRESS in attributes:
+        link['mac'] = ':'.join('%02x' % ord(char)
+                               for char in attributes[IFLA_ADDRESS])
+    for key, attr_type in (('master', IFLA_MASTER), ('parent', IFLA_LINK)):
+        if len(attributes.get(attr_type, '')) == 4:
+            link[key] = struct.unpack('=I', attributes[attr_type])[0]
+    if IFLA_LINKINFO in attributes:
+        info = attributes[IFLA_LINKINFO]
+        kind = _parse_attributes(info, 0, len(info)).get(IFLA_INFO_KIND)
+        if kind:
+            link['kind'] = kind.rstrip('\0')
+    return link
@@ -17,12 +17,12 @@
 #
 
 import glob
-import json
 import os
 import re
-import shlex
+import socket
 import subprocess
-import sys
+
+SYS_CLASS_NET = '/sys/class/net'
 
 
 """
@@ -331,54 +331,47 @@ def dmidecode():
 
 
 def ip():
+    """ Get the ethN devices, from netlink and sysfs """
     interfaces = []
     try:
-        output = subprocess.check_output(['/sbin/ip', 'link'])
-    except subprocess.CalledProcessError:
-        output = ''
-    parser = 'need_name'
-    name = ''
-    state = ''
-    for line in output.split('\n'):
-        pieces = line.split()
-        if len(pieces) == 0:
+        links = get_links()
+    except (socket.error, OSError):
+        links = []
+    for link in sorted(links, key=lambda link: link['index']):
+        name = link['name']
+        if link['type'] != ARPHRD_ETHER or not name.startswith('eth'):
             continue
-        if parser == 'need_name':
-            name = pieces[1].split(':')[0]
-            state = pieces[8]
-            parser = 'need_mac'
-        else:
-            is_ether = False
-            if pieces[0] == 'link/ether' and name.startswith('eth'):
-                is_ether = True
-                mac = pieces[1]
-
-            if is_ether:
-                interfaces.append({'name': name,
-                                   'device': [{'name': name,
-                                               'state': state,
-                                               'macaddr': mac}]})
-            parser = 'need_name'
-
-    # Add additional information to the device data
-    for interface in interfaces:
-        name = interface['name']
-        try:
-            output = subprocess.check_output(['/sbin/ethtool',  '%s' % name])
-        except subprocess.CalledProcessError:
-            output = ''
-        dev_info = interface.get('device')[0]
-        for line in output.split('\n'):
-            if line.strip().startswith('Link detected:'):
-                dev_info['link_detected'] = line.strip().split()[2]
-            elif line.strip().startswith('Duplex:'):
-                dev_info['duplex'] = line.strip().split()[1]
-            elif line.strip().startswith('Speed:'):
-                dev_info['speed'] = line.strip().split()[1]
+        dev_info = {'name': name,
+                    'state': link['state'],
+                    'macaddr': link['mac']}
+
+        # Add additional information to the device data, as ethtool
+        # would show it. The carrier can't be read while the link is
+        # administratively down, nor the speed or duplex without a carrier
+        carrier = read_sysfs(name, 'carrier')
+        dev_info['link_detected'] = 'yes' if carrier == '1' else 'no'
+        duplex = read_sysfs(name, 'duplex')
+        if duplex:
+            dev_info['duplex'] = duplex.capitalize()
+        speed = read_sysfs(name, 'speed')
+        if speed and speed.lstrip('-').isdigit() and int(speed) > 0:
+            dev_info['speed'] = '%sMb/s' % speed
+
+        interfaces.append({'name': name, 'device': [dev_info]})
 
     return interfaces
 
 
+def read_sysfs(interface, name, sys_path=SYS_CLASS_NET):
+    # Return the stripped content of a sysfs attribute of the interface,
+    # or None if it can't be read, e.g. the speed of a link which is down
+    try:
+        with open(os.path.join(sys_path, interface, name)) as sfile:
+            return sfile.read().strip()
+    except (IOError, OSError):
+        return None
+
+
 def meminfo():
     mem_info = {}
     with open('/proc/meminfo') as lines:
@@ -469,38 +462,27 @@ def zypper_lines(command):
 
 
 def main():
-    ipaddr = None
-    hostname = None
-    try:
-        args_file = sys.argv[1]
-        args_data = file(args_file).read()
-        arguments = shlex.split(args_data)
-    except (IndexError, IOError):
-        arguments = sys.argv  # Running interactively
-    for arg in arguments:
-        if "=" in arg:
-            (key, value) = arg.split('=')
-            if key == 'ipaddr':
-                ipaddr = value
-            if key == 'hostname':
-                hostname = value
+    # the netlink reader is shared with restart_networking through
+    # module_utils, so this is a new style module taking its arguments
+    # from AnsibleModule
+    module = AnsibleModule(
+        argument_spec=dict(
+            ipaddr=dict(required=False, default=None),
+            hostname=dict(required=False, default=None)
+        )
+    )
+    ipaddr = module.params['ipaddr']
+    hostname = module.params['hostname']
     ret={}
     try:
-        failed_msg = ''
         discovered_drives = drive_configuration()
         dmidata = dmidecode()
         interfaces = ip()
         mem_info = meminfo()
         packages = package_info()
     except AssertionError as msg:
-        failed_msg = msg
-        ret['failed'] = True
-        ret['rc'] = 1
-        ret['msg'] = str(failed_msg)
-        print(json.dumps(ret))
-        sys.exit(1)
-
-    ret['failed'] = False
+        module.fail_json(rc=1, msg=str(msg))
+
     ret['rc'] = 0
     ret['ansible_facts'] = \
     {
@@ -541,8 +523,11 @@ def main():
         }
     }
 
-    print(json.dumps(ret))
+    module.exit_json(**ret)
 
 
+# import module snippets
+from ansible.module_utils.basic import *
+from ansible.module_utils.ardana_netlink import ARPHRD_ETHER, get_links
 if __name__ == '__main__':
     main()
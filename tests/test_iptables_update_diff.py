@@ -0,0 +1,236 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# (c) Copyright 2018 SUSE LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+'''Check how iptables_update compares the active chains, as iptables-save
+prints them, with the rules it generates, and the iptables-restore lines
+it works out from the differences. The module needs ansible to be
+importable, as it is on the deployer.
+
+    python -m unittest discover tests
+'''
+
+import imp
+import os
+import unittest
+
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+MODULE_PATH = os.path.join(TESTS_DIR, os.pardir, 'library', 'iptables_update')
+
+ipu = imp.load_source('iptables_update', MODULE_PATH)
+
+PREFIX = 'ardana-INPUT'
+
+
+def saved(*rules):
+    '''Return iptables-save -c output of the filter table with the rules,
+       given as (chain, spec), and the chains they are in.
+    '''
+    chains = []
+    for chain, spec in rules:
+        if chain not in chains and chain != 'INPUT':
+            chains.append(chain)
+    return (['*filter', ':INPUT ACCEPT [0:0]'] +
+            [':%s - [0:0]' % chain for chain in chains] +
+            ['[0:0] -A %s %s' % rule for rule in rules] +
+            ['COMMIT'])
+
+
+def generated(*rules):
+    '''Return the commands iptables_update generates for the rules'''
+    chains = []
+    for chain, spec in rules:
+        if chain not in chains and chain != 'INPUT':
+            chains.append(chain)
+    return ([':%s -' % chain for chain in chains] +
+            ['-A %s %s' % rule for rule in rules])
+
+
+class CanonicalRuleTest(unittest.TestCase):
+
+    def setUp(self):
+        ipu._canonical_rules.clear()
+
+    def assertSame(self, rule, other):
+        self.assertEqual(ipu.canonical_rule(rule), ipu.canonical_rule(other))
+
+    def assertDiffer(self, rule, other):
+        self.assertNotEqual(ipu.canonical_rule(rule),
+                            ipu.canonical_rule(other))
+
+    def test_saved_form(self):
+        self.assertSame('-d 10.0.0.1 -p tcp --dport 22 -j ACCEPT',
+                        '-d 10.0.0.1/32 -p tcp -m tcp --dport 22 -j ACCEPT')
+        self.assertSame('--destination fd00::1 --protocol udp --jump DROP',
+                        '-d fd00::1/128 -p udp -j DROP')
+
+    def test_option_order(self):
+        self.assertSame('-p tcp --dport 22 -d 10.0.0.1 -j ACCEPT',
+                        '-d 10.0.0.1/32 -p tcp -m tcp --dport 22 -j ACCEPT')
+        self.assertSame('-j ACCEPT -m comment --comment "ssh" -s 10.0.0.0/8',
+                        '-s 10.0.0.0/8 -m comment --comment ssh -j ACCEPT')
+        self.assertSame('-m multiport --dports 22,80 -p tcp -j ACCEPT',
+                        '-p tcp -m multiport --dports 22,80 -j ACCEPT')
+        self.assertSame('-j LOG --log-level 4 --log-prefix "dropped: "',
+                        '-j LOG --log-prefix "dropped: "')
+
+    def test_match_order(self):
+        # the order of the matches is kept, as iptables -C does
+        self.assertDiffer('-m limit --limit 2/min -m state --state NEW '
+                          '-j ACCEPT',
+                          '-m state --state NEW -m limit --limit 2/min '
+                          '-j ACCEPT')
+
+    def test_quoted_comment(self):
+        self.assertSame('-m comment --comment "MGMT ssh" -j ACCEPT',
+                        "-m comment --comment 'MGMT ssh' -j ACCEPT")
+        self.assertSame('-m comment --comment "say \\"hi\\"" -j ACCEPT',
+                        '-m comment --comment \'say "hi"\' -j ACCEPT')
+        self.assertEqual(ipu.canonical_rule('-m comment --comment "a  b" '
+                                            '-j ACCEPT'),
+                         ('-m', 'comment', '--comment', 'a  b',
+                          '-j', 'ACCEPT'))
+        self.assertDiffer('-m comment --comment "MGMT ssh" -j ACCEPT',
+                          '-m comment --comment "MGMT http" -j ACCEPT')
+
+    def test_negation(self):
+        self.assertSame('! -s 10.0.0.0/8 -j DROP', '-s ! 10.0.0.0/8 -j DROP')
+        self.assertSame('-m state ! --state NEW -j ACCEPT',
+                        '-m state --state ! NEW -j ACCEPT')
+        self.assertDiffer('! -s 10.0.0.0/8 -j DROP', '-s 10.0.0.0/8 -j DROP')
+        self.assertDiffer('! -s 10.0.0.0/8 -d 10.0.0.1 -j DROP',
+                          '-s 10.0.0.0/8 ! -d 10.0.0.1 -j DROP')
+
+    def test_reject_default(self):
+        self.assertSame('-p tcp -j REJECT',
+                        '-p tcp -j REJECT --reject-with '
+                        'icmp-port-unreachable')
+        self.assertSame('-p tcp -j REJECT',
+                        '-p tcp -j REJECT --reject-with '
+                        'icmp6-port-unreachable')
+        self.assertDiffer('-p tcp -j REJECT',
+                          '-p tcp -j REJECT --reject-with tcp-reset')
+
+
+class DiffFilterChainsTest(unittest.TestCase):
+
+    def setUp(self):
+        ipu._canonical_rules.clear()
+
+    def diff(self, current, desired):
+        return ipu.diff_filter_chains(
+            ipu.parse_filter_chains(current, PREFIX),
+            ipu.parse_filter_chains(desired, PREFIX))
+
+    def test_unchanged(self):
+        current = saved(
+            ('INPUT', '-j ardana-INPUT'),
+            ('ardana-INPUT', '-i eth0 -j ardana-INPUT-MGMT'),
+            ('ardana-INPUT-MGMT', '-d 10.0.0.1/32 -p tcp -m tcp --dport 22 '
+                                  '-m comment --comment "MGMT ssh" '
+                                  '-j ACCEPT'),
+            ('ardana-INPUT-MGMT', '-j REJECT --reject-with '
+                                  'icmp-port-unreachable'))
+        desired = generated(
+            ('INPUT', '-j ardana-INPUT'),
+            ('ardana-INPUT', '-i eth0 -j ardana-INPUT-MGMT'),
+            ('ardana-INPUT-MGMT', '-p tcp -d 10.0.0.1 --dport 22 '
+                                  '-m comment --comment "MGMT ssh" '
+                                  '-j ACCEPT'),
+            ('ardana-INPUT-MGMT', '-j REJECT'))
+
+        self.assertEqual(self.diff(current, desired), ([], []))
+
+    def test_changed_chain(self):
+        current = saved(
+            ('INPUT', '-j ardana-INPUT'),
+            ('ardana-INPUT', '-i eth0 -j ardana-INPUT-MGMT'),
+            ('ardana-INPUT', '-i eth1 -j ardana-INPUT-EXT'),
+            ('ardana-INPUT-MGMT', '-s 10.0.0.0/8 -j ACCEPT'),
+            ('ardana-INPUT-EXT', '-j DROP'))
+        desired = generated(
+            ('INPUT', '-j ardana-INPUT'),
+            ('ardana-INPUT', '-i eth0 -j ardana-INPUT-MGMT'),
+            ('ardana-INPUT', '-i eth1 -j ardana-INPUT-EXT'),
+            ('ardana-INPUT-MGMT', '! -s 10.0.0.0/8 -j ACCEPT'),
+            ('ardana-INPUT-EXT', '-j DROP'))
+
+        updated, lines = self.diff(current, desired)
+
+        self.assertEqual(updated, ['ardana-INPUT-MGMT'])
+        self.assertEqual(lines, [':ardana-INPUT-MGMT -',
+                                 '-A ardana-INPUT-MGMT ! -s 10.0.0.0/8 '
+                                 '-j ACCEPT'])
+
+    def test_renamed_chain(self):
+        current = saved(
+            ('INPUT', '-j ardana-INPUT'),
+            ('ardana-INPUT', '-i eth0 -j ardana-INPUT-OLD'),
+            ('ardana-INPUT-OLD', '-j DROP'))
+        desired = generated(
+            ('INPUT', '-j ardana-INPUT'),
+            ('ardana-INPUT', '-i eth0 -j ardana-INPUT-NEW'),
+            ('ardana-INPUT-NEW', '-j DROP'))
+
+        updated, lines = self.diff(current, desired)
+
+        self.assertEqual(updated, ['ardana-INPUT', 'ardana-INPUT-NEW',
+                                   'ardana-INPUT-OLD'])
+        # the old chain is flushed with the chains jumping to it before
+        # it is deleted
+        self.assertEqual(lines, [':ardana-INPUT -',
+                                 ':ardana-INPUT-NEW -',
+                                 ':ardana-INPUT-OLD -',
+                                 '-A ardana-INPUT -i eth0 '
+                                 '-j ardana-INPUT-NEW',
+                                 '-A ardana-INPUT-NEW -j DROP',
+                                 '-X ardana-INPUT-OLD'])
+
+    def test_removed_chains(self):
+        current = saved(
+            ('INPUT', '-s 192.168.0.0/16 -j ACCEPT'),
+            ('INPUT', '-j ardana-INPUT'),
+            ('ardana-INPUT', '-i eth0 -j ardana-INPUT-MGMT'),
+            ('ardana-INPUT-MGMT', '-j DROP'))
+
+        updated, lines = self.diff(current, [])
+
+        self.assertEqual(updated, ['ardana-INPUT', 'ardana-INPUT-MGMT',
+                                   'INPUT'])
+        # the rules in INPUT which aren't ours are left alone
+        self.assertEqual(lines, [':ardana-INPUT -',
+                                 ':ardana-INPUT-MGMT -',
+                                 '-D INPUT -j ardana-INPUT',
+                                 '-X ardana-INPUT',
+                                 '-X ardana-INPUT-MGMT'])
+
+    def test_added_jump(self):
+        current = saved(
+            ('INPUT', '-s 192.168.0.0/16 -j ACCEPT'),
+            ('ardana-INPUT', '-j DROP'))
+        desired = generated(
+            ('INPUT', '-j ardana-INPUT'),
+            ('ardana-INPUT', '-j DROP'))
+
+        updated, lines = self.diff(current, desired)
+
+        self.assertEqual(updated, ['INPUT'])
+        self.assertEqual(lines, ['-A INPUT -j ardana-INPUT'])
+
+
+if __name__ == '__main__':
+    unittest.main()
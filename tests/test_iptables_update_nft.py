@@ -0,0 +1,200 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# (c) Copyright 2018 SUSE LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+'''Check the nft script the nft backend of iptables_update applies.
+
+run_command is faked and records the commands run, with the nft table
+they leave behind, so nothing on the host is changed. The module needs
+ansible to be importable, as it is on the deployer.
+
+    python -m unittest discover tests
+'''
+
+import imp
+import os
+import shutil
+import tempfile
+import unittest
+
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+MODULE_PATH = os.path.join(TESTS_DIR, os.pardir, 'library', 'iptables_update')
+
+ipu = imp.load_source('iptables_update', MODULE_PATH)
+
+
+class FakeModule(object):
+    '''Enough of AnsibleModule for the nft functions. nft list prints the
+       chains of the table last applied with nft -f, and the commands run
+       are recorded with the data written to them.
+    '''
+
+    def __init__(self):
+        self.chains = None
+        self.calls = []
+
+    def run_command(self, cmd, data=None):
+        self.calls.append((cmd, data))
+        if cmd.startswith('nft list'):
+            if self.chains is None:
+                return 1, '', 'Error: No such file or directory'
+            return 0, ''.join('\tchain %s {\n\t}\n' % name
+                              for name in self.chains), ''
+        if cmd == 'nft -f -':
+            chains = [line.split()[1] for line in data.splitlines()
+                      if line.startswith('\tchain ')]
+            self.chains = chains or self.chains
+        return 0, '', ''
+
+    def fail_json(self, **kwargs):
+        raise Exception(kwargs.get('msg'))
+
+    def payloads(self):
+        return [data for cmd, data in self.calls if cmd == 'nft -f -']
+
+
+def allow(chain, port, **kwargs):
+    rule = {'chain': chain, 'type': 'allow', 'protocol': 'tcp',
+            'port-range-min': port, 'port-range-max': port}
+    rule.update(kwargs)
+    return rule
+
+
+CHAINS = [dict(name='MGMT', interface='eth0'),
+          dict(name='EXT', interface='eth1')]
+RULES = {'10.0.0.1': [allow('MGMT', 22), allow('MGMT', 80),
+                      allow('MGMT', 53, protocol='udp')],
+         'fd00::1': [allow('MGMT', 22)],
+         '10.0.1.1': [dict(allow('EXT', 443), type='deny'),
+                      allow('EXT', 443, **{'remote-ip-prefix':
+                                           '192.168.0.0/24'})]}
+
+
+class NftBackendTest(unittest.TestCase):
+
+    def setUp(self):
+        ipu._chain_names.clear()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.state_file = os.path.join(self.tmp_dir, 'ardana.nft-state')
+        self.mgmt = ipu.get_chain_name_hashed(ipu.ROOT_PREFIX, 'MGMT')
+        self.ext = ipu.get_chain_name_hashed(ipu.ROOT_PREFIX, 'EXT')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def generate(self, rules):
+        return ipu.generate_nft_chains(FakeModule(), rules, CHAINS,
+                                       ipu.ROOT_PREFIX, True)
+
+    def test_new_table(self):
+        module = FakeModule()
+        updated, size = ipu.update_nft_table(module, self.generate(RULES),
+                                             self.state_file)
+
+        self.assertEqual(updated, sorted([self.mgmt, self.ext, 'input']))
+        payloads = module.payloads()
+        self.assertEqual(len(payloads), 1)
+        self.assertEqual(size, len(payloads[0]))
+        lines = payloads[0].splitlines()
+        self.assertEqual(lines[:3], ['add table inet ardana',
+                                     'delete table inet ardana',
+                                     'table inet ardana {'])
+        base = lines.index('\tchain input {')
+        self.assertEqual(lines[base + 1:base + 4], [
+            '\t\ttype filter hook input priority 0; policy accept;',
+            '\t\tiifname vmap { "eth0" : jump %s, "eth1" : jump %s }' %
+            (self.mgmt, self.ext),
+            '\t}'])
+        # the base chain comes after the chains it jumps to
+        self.assertTrue(lines.index('\tchain %s {' % self.mgmt) < base)
+        self.assertTrue(lines.index('\tchain %s {' % self.ext) < base)
+
+    def test_port_vmap(self):
+        nft_chains = self.generate(RULES)
+
+        self.assertEqual(nft_chains[self.mgmt][:3], [
+            'ip daddr . tcp dport vmap '
+            '{ 10.0.0.1 . 22 : accept, 10.0.0.1 . 80 : accept }',
+            'ip daddr . udp dport vmap { 10.0.0.1 . 53 : accept }',
+            'ip6 daddr . tcp dport vmap { fd00::1 . 22 : accept }'])
+        # a chain with a deny rule keeps its rules in order
+        self.assertEqual(nft_chains[self.ext][:2], [
+            'ip daddr 10.0.1.1 tcp dport 443 drop comment "EXT"',
+            'ip saddr 192.168.0.0/24 ip daddr 10.0.1.1 tcp dport 443 '
+            'accept comment "EXT"'])
+
+    def test_protocols(self):
+        rules = {'10.0.0.1': [allow('MGMT', None, protocol='all'),
+                              allow('MGMT', None, protocol='vrrp'),
+                              allow('MGMT', None, protocol='112'),
+                              allow('MGMT', None, protocol='tcp')],
+                 'fd00::1': [allow('MGMT', None, protocol='icmp')]}
+        nft_chains = self.generate(rules)
+
+        self.assertEqual(nft_chains[self.mgmt][:5], [
+            'ip daddr 10.0.0.1 accept comment "MGMT"',
+            'ip daddr 10.0.0.1 meta l4proto 112 accept comment "MGMT"',
+            'ip daddr 10.0.0.1 meta l4proto 112 accept comment "MGMT"',
+            'ip daddr 10.0.0.1 meta l4proto 6 accept comment "MGMT"',
+            'ip6 daddr fd00::1 meta l4proto 58 accept comment "MGMT"'])
+
+        rules = {'10.0.0.1': [allow('MGMT', None, protocol='no-such')]}
+        self.assertRaises(Exception, self.generate, rules)
+
+    def test_changed_chain_only(self):
+        module = FakeModule()
+        ipu.update_nft_table(module, self.generate(RULES), self.state_file)
+
+        rules = dict(RULES)
+        rules['10.0.0.1'] = RULES['10.0.0.1'] + [allow('MGMT', 443)]
+        updated, size = ipu.update_nft_table(module, self.generate(rules),
+                                             self.state_file)
+
+        self.assertEqual(updated, [self.mgmt])
+        lines = module.payloads()[-1].splitlines()
+        self.assertEqual(lines[:2], [
+            'add chain inet ardana %s' % self.mgmt,
+            'flush chain inet ardana %s' % self.mgmt])
+        self.assertIn('add rule inet ardana %s ip daddr . tcp dport vmap '
+                      '{ 10.0.0.1 . 22 : accept, 10.0.0.1 . 80 : accept, '
+                      '10.0.0.1 . 443 : accept }' % self.mgmt, lines)
+        self.assertFalse([line for line in lines if self.ext in line])
+
+    def test_up_to_date(self):
+        module = FakeModule()
+        ipu.update_nft_table(module, self.generate(RULES), self.state_file)
+        del module.calls[:]
+
+        updated, size = ipu.update_nft_table(module, self.generate(RULES),
+                                             self.state_file)
+
+        self.assertEqual((updated, size), ([], 0))
+        self.assertEqual(module.payloads(), [])
+
+    def test_check_mode(self):
+        module = FakeModule()
+        updated, size = ipu.update_nft_table(module, self.generate(RULES),
+                                             self.state_file, check=True)
+
+        self.assertTrue(updated)
+        self.assertTrue(size)
+        self.assertEqual(module.payloads(), [])
+        self.assertFalse(os.path.exists(self.state_file))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,208 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# (c) Copyright 2018 SUSE LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+'''Run restart_networking against interface and shadow directories in a
+temporary directory. AnsibleModule is faked and the runs only go as far
+as finding that no restart is needed, so nothing on the host is changed.
+The module needs ansible to be importable, as it is on the deployer.
+
+    python -m unittest discover tests
+'''
+
+import imp
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import ansible.module_utils
+
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+MODULE_PATH = os.path.join(TESTS_DIR, os.pardir, 'library',
+                           'restart_networking')
+NETLINK_PATH = os.path.join(TESTS_DIR, os.pardir, 'module_utils',
+                            'ardana_netlink.py')
+
+# ansible finds the module_utils next to the playbooks, here they are
+# loaded where the module imports them from
+imp.load_source('ansible.module_utils.ardana_netlink', NETLINK_PATH)
+rn = imp.load_source('restart_networking', MODULE_PATH)
+
+MARKER = '# Ardana managed'
+
+
+class ModuleExit(SystemExit):
+    pass
+
+
+class FakeModule(object):
+    '''Enough of AnsibleModule for main. exit_json and fail_json raise
+       ModuleExit with the result, as the real ones exit.
+    '''
+
+    params = {}
+
+    def __init__(self, **kwargs):
+        self.params = dict(FakeModule.params)
+
+    def boolean(self, value):
+        return value in rn.BOOLEANS[0::2] + ['True']
+
+    def run_command(self, cmd, **kwargs):
+        raise AssertionError('unexpected command: %s' % cmd)
+
+    def exit_json(self, **kwargs):
+        raise ModuleExit(kwargs)
+
+    def fail_json(self, **kwargs):
+        kwargs['failed'] = True
+        raise ModuleExit(kwargs)
+
+
+class ManifestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.interfaces_path = os.path.join(self.tmp_dir, 'network-scripts')
+        os.mkdir(self.interfaces_path)
+        self.write(self.interfaces_path, 'ifcfg-eth0')
+        self.write(self.interfaces_path, 'ifcfg-lo', marker='')
+
+        self.saved = (rn.AnsibleModule, rn.init_logging, rn.MANIFEST_DIR)
+        rn.AnsibleModule = FakeModule
+        rn.init_logging = lambda: None
+        rn.MANIFEST_DIR = os.path.join(self.tmp_dir, 'cache')
+
+    def tearDown(self):
+        rn.AnsibleModule, rn.init_logging, rn.MANIFEST_DIR = self.saved
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, path, name, marker=MARKER):
+        with open(os.path.join(path, name), 'w') as ifile:
+            ifile.write('%s\nDEVICE=%s\n' % (marker, name.partition('-')[2]))
+
+    def run_module(self, tables=()):
+        # the playbook makes a new shadow directory for every run
+        shadow_path = tempfile.mkdtemp(dir=self.tmp_dir)
+        self.write(shadow_path, 'ifcfg-eth0')
+        FakeModule.params = dict(
+            interfaces_path=self.interfaces_path, shadow_path=shadow_path,
+            force_restart=False, restart_ovs=False,
+            management_pattern=MARKER, routing_tables=list(tables),
+            routing_table_file=os.path.join(self.tmp_dir, 'rt_tables'),
+            routing_table_marker='ardana', routing_table_id_start=101,
+            restart_mode='full', settle_timeout=20, flush_concurrency=8,
+            install_mode='copy', os_family='RedHat')
+        try:
+            rn.main()
+        except ModuleExit as e:
+            result = e.args[0]
+        shutil.rmtree(shadow_path)
+        self.assertFalse(result.get('failed'), result.get('msg'))
+        return result
+
+    def test_manifest_reused(self):
+        result = self.run_module()
+        self.assertEqual(result['manifest'], dict(files=2, unchanged=0))
+        self.assertEqual(result['pattern_scan']['files'], 2)
+
+        result = self.run_module()
+        self.assertEqual(result['manifest'], dict(files=2, unchanged=2))
+        self.assertEqual(result['pattern_scan']['files'], 0)
+        self.assertFalse(result['changed'])
+        self.assertFalse(result['restarted'])
+
+        # the manifest is kept apart from the shadow directories
+        self.assertEqual(os.listdir(rn.MANIFEST_DIR), [
+            'restart_networking-%s.manifest' %
+            self.interfaces_path.strip('/').replace('/', '-')])
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)),
+                         ['cache', 'network-scripts'])
+
+    def test_changed_file_read(self):
+        self.run_module()
+        with open(os.path.join(self.interfaces_path, 'ifcfg-lo'), 'a') as f:
+            f.write('ONBOOT=yes\n')
+
+        result = self.run_module()
+        self.assertEqual(result['manifest'], dict(files=2, unchanged=1))
+        self.assertEqual(result['pattern_scan']['files'], 1)
+
+    def test_route_tables_changed(self):
+        self.run_module()
+
+        # the network isn't restarted, but the rewrite is reported
+        result = self.run_module(tables=['MANAGEMENT'])
+        self.assertTrue(result['changed'])
+        self.assertFalse(result['restarted'])
+        self.assertEqual(result['route_tables'],
+                         dict(changed=True, tables=dict(MANAGEMENT=101)))
+        with open(os.path.join(self.tmp_dir, 'rt_tables')) as tfile:
+            self.assertIn('101 MANAGEMENT #ardana\n', tfile.read())
+
+        result = self.run_module(tables=['MANAGEMENT'])
+        self.assertFalse(result['changed'])
+
+
+class FlushInterfacesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = rn.run_flush_command
+        rn.run_flush_command = self.run_flush_command
+        self.lock = threading.Lock()
+        self.calls = []
+        self.ifdowns = 0
+        self.overlapped = False
+
+    def tearDown(self):
+        rn.run_flush_command = self.saved
+
+    def run_flush_command(self, cmd):
+        ifdown = ' ifdown ' in cmd
+        with self.lock:
+            self.calls.append(cmd.split()[-1 if ifdown else -2])
+            if ifdown:
+                self.ifdowns += 1
+                self.overlapped = self.overlapped or self.ifdowns > 1
+        time.sleep(0.01)
+        with self.lock:
+            if ifdown:
+                self.ifdowns -= 1
+        return 0
+
+    def test_uppers_first(self):
+        links = set([('eth0', 'bond0', 'slave'), ('eth1', 'bond0', 'slave'),
+                     ('bond0', 'vlan10', 'vlan')])
+        flushed = rn.flush_interfaces(
+            FakeModule(), 'Debian', links, 8,
+            interfaces=['eth0', 'eth1', 'bond0', 'vlan10', 'eth2', 'lo'])
+
+        self.assertEqual(sorted(flushed),
+                         ['bond0', 'eth0', 'eth1', 'eth2', 'vlan10'])
+        # an interface is only brought down once those on it are
+        last = dict((name, idx) for idx, name in enumerate(self.calls))
+        self.assertTrue(last['vlan10'] < self.calls.index('bond0'))
+        self.assertTrue(last['bond0'] < self.calls.index('eth0'))
+        self.assertTrue(last['bond0'] < self.calls.index('eth1'))
+        self.assertFalse(self.overlapped)
+
+
+if __name__ == '__main__':
+    unittest.main()